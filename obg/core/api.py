@@ -5,13 +5,16 @@ from obg.core import protocols, statistics, tree, process, evaluation, exception
 from obg.utils.logging import logger, Log
 
 import operator
+import sys
+from collections import deque
 
 from itertools import chain
-import copy
 import time
 
 DEFAULT_PROTOCOL = protocols.DefaultProtcol()
 STARTING_PROCESS = 0
+# bound on how many equal-best evaluations are kept around
+MAX_MATCHING_BEST = 16
 
 class Generator:
     '''
@@ -32,6 +35,7 @@ class Generator:
         
         self.data = data
         self.options = options
+        self._allowed_opts = frozenset(options)
         self.number_of_blocks = number_of_blocks
         self.protocol = protocol or DEFAULT_PROTOCOL
         self.class_size = class_size
@@ -46,9 +50,11 @@ class Generator:
         }
         self.cache = None
         self._ready = False
+        self._eval_util = None
+        self._initial_classes = None
         self.node = None
         self.best_evaluation = None
-        self.matching_best = []
+        self.matching_best = deque(maxlen=MAX_MATCHING_BEST)
         
         self.opts = opts
         
@@ -69,12 +75,15 @@ class Generator:
         # stage 1: initialise some variables
         self.check_protocols()
         statistics.State.creation_counter = 0
-        evaluation.EvaluatedObject.creation_count = 0
-        
-        
+        evaluation.reset_evaluation_ids()
+
+
         if self.protocol.is_using(protocols.OrderingProtocol):
             self.options = sorted(self.options)
-        
+        # intern subject codes up front so every structure built from them
+        # shares the same string objects
+        self.options = [sys.intern(option) for option in self.options]
+
         self.cache = statistics.Cache(self.data, self.options)
         self.cache.debug_options = self.opts.pop("debug_options", {})
         self.cache.logger = Log(**self.cache.debug_options)
@@ -88,6 +97,7 @@ class Generator:
         initial_state.cache = self.cache
         initial_state.stats = statistics.CachedStats(self.cache)
         initial_state.blocks = [[] for _ in range(self.number_of_blocks)]
+        initial_state.masks = [0] * self.number_of_blocks
         initial_state.process_index = STARTING_PROCESS 
         initial_state.current_process = process.PROCESSES[STARTING_PROCESS]    
         
@@ -106,21 +116,58 @@ class Generator:
             option_codes=self.options
         )
         initial_state.classes = statistics.calculate_classes(
-            self.cache.popularity, 
-            class_size=self.class_size, 
+            self.cache.popularity,
+            class_size=self.class_size,
             maximum=self.number_of_blocks
         )
-        
+        self._initial_classes = dict(initial_state.classes)
+
         
         self.cache.protocol = self.protocol
         node.state = initial_state
         node.cache = self.cache
         self.node = node
+        self._eval_util = evaluation.EvaluationUtility(self.cache)
         
         logger.debug("generator setup finished")
         self._ready = True
         return True
-        
+
+    def setup_iteration(self):
+        '''
+        lightweight re-setup between generation passes. Reuses the popularity
+        and class statistics computed by setup() instead of rescanning the
+        data, only rebuilding the node and its state
+        '''
+        statistics.State.creation_counter = 0
+        evaluation.reset_evaluation_ids()
+
+        self.cache.generated_states = set()
+        self.cache._last_state = None
+        self.cache.process_cache = dict()
+        self.cache.within_deamon = False
+
+        node = tree.Node()
+        node.util = evaluation.EvaluationUtility(self.cache)
+        node.opts = self.opts
+        node.protocol = self.protocol
+
+        initial_state = statistics.State()
+        initial_state.cache = self.cache
+        initial_state.stats = statistics.CachedStats(self.cache)
+        initial_state.blocks = [[] for _ in range(self.number_of_blocks)]
+        initial_state.masks = [0] * self.number_of_blocks
+        initial_state.process_index = STARTING_PROCESS
+        initial_state.current_process = process.PROCESSES[STARTING_PROCESS]
+        initial_state.classes = dict(self._initial_classes)
+
+        node.state = initial_state
+        node.cache = self.cache
+        self.node = node
+
+        self._ready = True
+        return True
+
     def get_subject_classes(self, subject:str):
         '''returns the number of classes this subject has '''
         count = self.node.state.classes.get(subject)
@@ -135,15 +182,20 @@ class Generator:
         '''
         update the number of classes a given subject gets
         '''
+        current = self.node.state.classes
+        missing = classes.keys() - current.keys()
+        if missing:
+            raise exceptions.SubjectNotFound(
+                "'%s' is not a valid subject" % missing.pop()
+            )
         for subject, klass in classes.items():
-            self.get_subject_classes(subject)
             if klass > self.number_of_blocks:
                 raise exceptions.ImproperlyConfigured(
                     "defining '%s' exceeds the maximum number of blocks '%s'" % (
                         subject, self.number_of_blocks
                     )
                 )
-        self.node.state.classes.update(**classes)
+        current.update(classes)
         
     def pre_run(self):
         # run all checks 
@@ -164,7 +216,7 @@ class Generator:
         except KeyboardInterrupt:
             logger.fatal("generation process MANUALLY terminated")
         except exceptions.TerminateGeneration as t:
-            logger.error("[generation INTERALLY terminated] '%s'" % t.reason)
+            logger.error("[generation INTERALLY terminated] '%s'", t.reason)
         
         end = time.perf_counter()
         self.stats["generation_time"] = end-start
@@ -175,49 +227,65 @@ class Generator:
         # handle clean up or calculate stats
         self.stats["generated_blocks"] = len(self.cache.generated_states)
         
-    def run_with_threshold(self, min_students:int=5, max_students:int=30):
+    def run_with_threshold(self, min_students:int=5, max_students:int=30, max_iterations:int=20):
         '''
         generate a set of option blocks where classes meet a given threshold of students.
         If a class does not meet the threshold, the number of classes it gets is decremented
-        and the generation process repeats. 
+        and the generation process repeats. Stops after 'max_iterations' passes or when
+        the same class allocation reoccurs, as the search would otherwise oscillate forever.
         '''
-        tracker = copy.deepcopy(self.node.state.classes)
+        tracker = dict(self.node.state.classes)
         iteration = 0
-            
-        while True:
+        seen_trackers = set()
+
+        while iteration < max_iterations:
+            state_key = tuple(sorted(tracker.items()))
+            if state_key in seen_trackers:
+                break
+            seen_trackers.add(state_key)
+
             self.node.state.classes = tracker.copy()
             self.run()
-            iteration + 1
+            iteration += 1
 
             evaluation = self.evaluate()
             self.cache.logger.output(
-                "iteration '%i' has a success rate of '%f'" % (iteration, evaluation.success_percentage), level="fatal")
+                "iteration '%i' has a success rate of '%f'", iteration, evaluation.success_percentage, level="fatal")
             if evaluation.success_percentage == 0:
                 break
             with_students = evaluation.calculate_students(sentinel=max_students)
-            smallest = list(with_students.blocks.get_classes(min_students))
-            largest = list(with_students.blocks.get_classes(max_students, operation=operator.ge, maximum=max_students))
-            
-            if len(smallest) <= 0 and len(largest) <= 0:
+            smallest = list(with_students.blocks.iter_classes(min_students))
+            largest = with_students.blocks.iter_classes(
+                max_students, operation=operator.ge, maximum=max_students)
+            # only pull the first oversized class so an empty threshold scan
+            # can terminate without materialising the whole list
+            first_largest = next(largest, None)
+
+            if not smallest and first_largest is None:
                 break
             # self.options = {"debug_options":{"branching":False, "process_completion":False, "evaluation": False}}
-            self.setup()
-            
+            self.setup_iteration()
+
             for subject in smallest:
                 classes = tracker.get(subject.code)
                 tracker[subject.code] = classes-1
-                   
-            
-            for subject in largest:
-                classes = tracker.get(subject.code)                
-                tracker[subject.code] = classes+1        
+
+
+            if first_largest is not None:
+                for subject in chain((first_largest,), largest):
+                    classes = tracker.get(subject.code)
+                    tracker[subject.code] = classes+1
             
     def evaluate(self, with_pathways=False):
         '''
         evaluate all the generated option blocks
         '''
         start = time.perf_counter()
-        utility = evaluation.EvaluationUtility(self.node.cache)
+        # reuse the utility built during setup so repeated evaluate() calls
+        # (one per run_with_threshold iteration) share its derived state
+        utility = self._eval_util
+        if utility is None:
+            utility = self._eval_util = evaluation.EvaluationUtility(self.node.cache)
         utility.calculate_pathways = with_pathways
         best = evaluation.EvaluatedObject()
         try:
@@ -230,6 +298,7 @@ class Generator:
                     best = result
                 elif result.success_percentage > best.success_percentage:
                     best = result
+                    self.matching_best.clear()
                 elif result.success_percentage == best.success_percentage:
                     self.matching_best.append(result)
                     
@@ -249,25 +318,25 @@ class Generator:
             )
             
     def check_data(self):
-        allowed_opts = set(self.options)
+        allowed_opts = self._allowed_opts
         for id, options in self.data.items():
             if len(options) > self.number_of_blocks:
                 raise exceptions.ValidationError(
                     "'%s' has a number of options that exceeds the maximum number of blocks" % id
                 )
-            for opt in options:
-                if opt not in allowed_opts:
-                    raise exceptions.ValidationError(
-                        "invalid option '%s'" % opt  
-                    )
+            if not allowed_opts.issuperset(options):
+                bad = set(options) - allowed_opts
+                raise exceptions.ValidationError(
+                    "invalid option '%s'" % bad.pop()
+                )
     
     def check_subjects(self, iterable: Iterable):
-        
-        for subject in iterable:
-            if subject not in self.cache.option_codes:
-                raise exceptions.SubjectNotFound(
-                    "subject '%s' is not a valid subject code" % subject 
-                )
+
+        missing = set(iterable).difference(self.cache.option_codes)
+        if missing:
+            raise exceptions.SubjectNotFound(
+                "subject '%s' is not a valid subject code" % missing.pop()
+            )
         
     def check_evaluation(self, evaluation: evaluation.EvaluatedObject):
         try:
@@ -280,7 +349,7 @@ class Generator:
     def pprint_statistics(self):
         
         for stat, result in self.stats.items():
-            logger.debug("[%s] => (%s)" % (stat, result))
+            logger.debug("[%s] => (%s)", stat, result)
             
     def define_ebacc(self, 
                   humanities: List[str], 
@@ -299,9 +368,11 @@ class Generator:
                 )
         
         self.cache.Ebacc = {
-            "humanities": humanities,
-            "sciences": science,
-            "languages": languages,
-            "vocational": vocational
+            "humanities": frozenset(humanities),
+            "sciences": frozenset(science),
+            "languages": frozenset(languages),
+            "vocational": frozenset(vocational)
         }
+        # fast "is an EBacc subject at all" lookup
+        self.cache.Ebacc_any = frozenset().union(*self.cache.Ebacc.values())
         
@@ -2,141 +2,223 @@ from typing import List
 from obg.core import statistics, evaluation, exceptions
 
 import operator
-from itertools import chain
+import array
+import sys
 
-from dataclasses import dataclass
+_ZEROS = array.array("i", [0])
 
-import copy
+def _mask_of(codes, option_id):
+    # fold a block's codes into a single membership bitmask
+    mask = 0
+    for code in codes:
+        mask |= 1 << option_id[code]
+    return mask
 
 class OptionBlocks:
     '''
-    set of generated option blocks
+    set of generated option blocks. Blocks are stored struct-of-arrays style:
+    one list of subject codes and one parallel array of student counts per
+    block, so ClassOption objects are only materialised when a caller asks
+    for them
     '''
     def __init__(self, blocks: List[List[str]], _cache: statistics.Cache) -> None:
-        self.blocks: List[List[ClassOption]] = [
-            [ClassOption(subject) if not isinstance(
-                subject, ClassOption) 
-            else subject for subject in block] for block in blocks
-        ]                    
-                    
+        # raw generation passes uniform lists of codes, so detect that case
+        # once and skip the per-subject isinstance dispatch entirely
+        sample = next((block[0] for block in blocks if block), None)
+        intern = sys.intern
+        if sample is None or isinstance(sample, str):
+            # intern codes so the handful of distinct subject strings are
+            # shared and equality tests short-circuit on identity
+            self._codes: List[List[str]] = [
+                [intern(code) for code in block] for block in blocks
+                ]
+            self._students: List[array.array] = [_ZEROS * len(block) for block in blocks]
+        else:
+            self._codes = []
+            self._students = []
+            for block in blocks:
+                codes = []
+                students = array.array("i")
+                for subject in block:
+                    if isinstance(subject, ClassOption):
+                        codes.append(intern(subject.code))
+                        students.append(subject.students)
+                    else:
+                        codes.append(intern(subject))
+                        students.append(0)
+                self._codes.append(codes)
+                self._students.append(students)
+        option_id = _cache.option_id
+        self._masks: List[int] = [
+            _mask_of(codes, option_id) for codes in self._codes
+            ]
+        self._views: List[List["ClassOption"]] = [None] * len(self._codes)
+
         self._cache = _cache
-        
+
+    @classmethod
+    def _from_arrays(cls, codes, students, _cache):
+        # fast construction path used internally when the parallel arrays
+        # already exist and do not need normalising
+        new = cls.__new__(cls)
+        new._codes = codes
+        new._students = students
+        option_id = _cache.option_id
+        new._masks = [_mask_of(block, option_id) for block in codes]
+        new._views = [None] * len(codes)
+        new._cache = _cache
+        return new
+
     def __len__(self):
-        return len(self.blocks)
-    
+        return len(self._codes)
+
     def __iter__(self):
-        return iter(self.blocks)
-    
+        return (self[pos] for pos in range(len(self._codes)))
+
     def __getitem__(self, pos):
-        return self.blocks[pos]
-    
+        view = self._views[pos]
+        if view is None:
+            view = [ClassOption(self, pos, i) for i in range(len(self._codes[pos]))]
+            self._views[pos] = view
+        return view
+
     def __setitem__(self, __pos, __value):
         raise NotImplementedError(
             "cannot support scripting. Instead use .add_class to add a new subject")
-        
+
     def add_class(self, block:int, subject:str):
         '''
         add a class to the block
         '''
         subject = self.normalise(subject)
-        
-        if subject in self.blocks[block]:
+
+        bit = 1 << self._cache.option_id[subject]
+        if self._masks[block] & bit:
             raise exceptions.SubjectAlreadyExists(
-                "subject '%s' already exists in block '%i'" % (subject.code, block))
-        
-        self.blocks[block].append(subject)
-        
+                "subject '%s' already exists in block '%i'" % (subject, block))
+
+        self._codes[block].append(subject)
+        self._students[block].append(0)
+        self._masks[block] |= bit
+        self._views[block] = None
+
     def remove_class(self, block:int, subject:str):
         '''
         remove a class from the block
         '''
         subject = self.normalise(subject)
-        
-        if subject not in self.blocks[block]:
+
+        bit = 1 << self._cache.option_id[subject]
+        if not self._masks[block] & bit:
             raise exceptions.SubjectNotFound("subject '%s' not found in block '%i'" % (subject, block))
-        
-        self.blocks[block].remove(subject)
-        
+
+        index = self._codes[block].index(subject)
+        self._codes[block].pop(index)
+        self._students[block].pop(index)
+        self._masks[block] &= ~bit
+        self._views[block] = None
+
     def move_class(self, target:int, to:int, subject:str):
         '''
         move a class from 'target' to another block 'to'
         '''
-        if subject not in self.blocks[target]:
+        bit = 1 << self._cache.option_id[subject]
+        if not self._masks[target] & bit:
             raise exceptions.SubjectNotFound("subject '%s' not found in block '%i'" % (subject, target))
-        if subject in self.blocks[to]:
+        if self._masks[to] & bit:
             raise exceptions.SubjectAlreadyExists(
-                "subject '%s' already exists in block '%i'" % (subject.code, to)
+                "subject '%s' already exists in block '%i'" % (subject, to)
                 )
         self.remove_class(target, subject)
         self.add_class(to, subject)
 
-        
+
     def normalise(self, subject:str):
-        '''convert a subject to an object'''
-        if not isinstance(subject, ClassOption):
-            if not isinstance(subject, str):
-                raise TypeError("item to add must be a string")
-            subject = ClassOption(subject)
-        return subject
-    
+        '''convert a subject to its code'''
+        if isinstance(subject, ClassOption):
+            return sys.intern(subject.code)
+        if not isinstance(subject, str):
+            raise TypeError("item to add must be a string")
+        return sys.intern(subject)
+
     def copy(self):
-        blocks = copy.deepcopy(self.blocks)
-        return self.__class__(blocks, self._cache)
-    
+        return self.__class__._from_arrays(
+            [list(codes) for codes in self._codes],
+            [array.array("i", students) for students in self._students],
+            self._cache
+            )
+
     def raw(self):
-        return [[subject.code for subject in block] for block in self.blocks]
-    
+        return [list(codes) for codes in self._codes]
+
     def _subject_popularity(self):
-        return statistics.subject_popularity(
-            self._cache.data,
-            self._cache.option_codes
-            )
+        # popularity only depends on the cache data, which is fixed for the
+        # lifetime of a generation pass, so compute it at most once
+        popularity = self._cache.popularity
+        if not popularity:
+            popularity = self._cache.popularity = statistics.subject_popularity(
+                self._cache.data,
+                self._cache.option_codes
+                )
+        return popularity
 
     def retrieve(self, block:int, subject:str):
-        for klass in self.blocks[block]:
-            if klass.code == subject:
-                return klass
+        if self._masks[block] >> self._cache.option_id[subject] & 1:
+            return self[block][self._codes[block].index(subject)]
         raise exceptions.SubjectNotFound(
             "subject '%s' was not found in block '%s'" % (subject, block)
         )
-        
-                    
+
+
     def discard_small_classes(self, minimum:int=0):
         '''
         remove classes which have a number of subjects less than the minimum. If not provided,
         classes with 0 students will be discarded.
         '''
-        populated_blocks = [[] for _ in range(len(self.blocks))]
-        for index, block in enumerate(self.blocks):
-            for subject in block:
-                if subject.students > minimum:
-                    populated_blocks[index].append(subject)
-        return self.__class__(populated_blocks, self._cache)
-    
+        codes = []
+        students = []
+        for block_codes, block_students in zip(self._codes, self._students):
+            populated_codes = []
+            populated_students = array.array("i")
+            for code, count in zip(block_codes, block_students):
+                if count > minimum:
+                    populated_codes.append(code)
+                    populated_students.append(count)
+            codes.append(populated_codes)
+            students.append(populated_students)
+        return self.__class__._from_arrays(codes, students, self._cache)
+
+    def iter_classes(self, students:int, operation=operator.lt, minimum=0, maximum=40):
+        '''
+        lazily yield classes which have less than a given number of students.
+        Use when only presence or a single pass is needed
+        '''
+        op = operation
+        for block in range(len(self._codes)):
+            # read counts straight off the backing array and only build the
+            # ClassOption views for blocks that actually produce a match
+            view = None
+            for pos, count in enumerate(self._students[block]):
+                if minimum < count < maximum and op(count, students):
+                    if view is None:
+                        view = self[block]
+                    yield view[pos]
+
     def get_classes(self, students:int, operation=operator.lt, minimum=0, maximum=40):
         '''
-        returns a tuple of classes which have less than a given number of students. 
+        returns a tuple of classes which have less than a given number of students.
         allow_max = False will leave out classes equal or greater than the number of blocks
         '''
-        # if not allow_max:
-        #     return tuple(chain(
-        #         *[[subject for subject in block if operation(subject.students, students) and subject.students < len(self.blocks)] 
-        #           for block in self.blocks]
-                
-            
-        return tuple(
-            chain(*[[subject for subject in block if operation(subject.students, students) and subject.students > minimum and subject.students < maximum
-                     ] for block in self.blocks
-                    ]))
-
-    
+        return tuple(self.iter_classes(students, operation, minimum, maximum))
+
+
     def collate_student_options(self):
         '''return sum of all students in the option blocks'''
-        return sum([sum([subject.students for subject in block]) for block in self.blocks])
-    
+        return sum(map(sum, self._students))
+
     def collate_number_of_options(self):
         '''returns the total number of options from the cache data'''
-        return sum([len(options) for options in self._cache.data.values()])
+        return sum(map(len, self._cache.data.values()))
 
     def check(self):
         '''
@@ -145,43 +227,66 @@ class OptionBlocks:
         diff = self.collate_number_of_options() - self.collate_student_options()
         if diff != 0:
             self._cache.logger.output(
-                msg="'%s' options were lost" % (diff),
+                "'%s' options were lost", diff,
                 level="fatal"
             )
-            
+
     def evaluate(self, **opts):
         '''
         evaluate this set of option blocks. Note, students calculated will be discarded
         '''
         util = evaluation.EvaluationUtility(self._cache, **opts)
         return util.evaluate_blocks(self.raw())
-        
+
     def pprint(self, full_repr=False):
         '''
         pretty print blocks to stdout
         '''
-        for block in self.blocks:
+        for block in self:
             if full_repr:
                 print(block)
             else:
                 print(", ".join(map(str, block)))
-                
-    
-    
-@dataclass(slots=True)
+
+
+
 class ClassOption:
     '''
-    represents a class in the option blocks
+    represents a class in the option blocks. Acts as a thin view over the
+    backing code/student arrays so reads and writes go straight through
     '''
-    code: str
-    students: int = 0
-    
+    __slots__ = ("_blocks", "_block", "_pos")
+
+    def __init__(self, blocks: OptionBlocks, block:int, pos:int) -> None:
+        self._blocks = blocks
+        self._block = block
+        self._pos = pos
+
+    @property
+    def code(self) -> str:
+        return self._blocks._codes[self._block][self._pos]
+
+    @property
+    def students(self) -> int:
+        return self._blocks._students[self._block][self._pos]
+
+    @students.setter
+    def students(self, value:int):
+        self._blocks._students[self._block][self._pos] = value
+
     def __str__(self) -> str:
-        return "%s(%i)" % (self.code, self.students)    
-    
+        return "%s(%i)" % (self.code, self.students)
+
+    def __repr__(self) -> str:
+        return "ClassOption(code=%r, students=%i)" % (self.code, self.students)
+
     def __eq__(self, __value: object) -> bool:
+        if isinstance(__value, ClassOption):
+            return __value.code == self.code
         return __value == self.code
 
+    def __hash__(self) -> int:
+        return hash(self.code)
+
     def increment_students(self, value=1):
-        self.students += value
-        
+        self._blocks._students[self._block][self._pos] += value
@@ -1,17 +1,31 @@
-import copy
 from typing import Any, Dict, List, Tuple, Iterable
 
 from obg.core import pathways, statistics, exceptions
 from obg.core.blocks import OptionBlocks
 from obg.utils import config, logging
 
+import functools
+import itertools
+import os
 import signal
+from collections import Counter
+from operator import itemgetter
 
 
-def initializer():
-    """Ignore CTRL+C in the worker process."""
+# evaluation utility shared by all tasks in a worker process; sent once
+# through the pool initializer instead of being pickled with every task
+_WORKER_UTIL: "EvaluationUtility" = None
+
+def _worker_init(util):
+    """Install the shared utility and ignore CTRL+C in the worker process."""
+    global _WORKER_UTIL
     signal.signal(signal.SIGINT, signal.SIG_IGN)
-    
+    _WORKER_UTIL = util
+
+def _worker_evaluate_blocks(blocks):
+    return _WORKER_UTIL.evaluate_blocks(blocks)
+
+
 # evaluation will use multiprocessing when there are more than
 # this many states
 MULTIPROCESS_THRESHOLD = 50
@@ -20,15 +34,24 @@ FAILED_OPTION_PRIORITY = config.Config.getint(
 )
 
 
+# evaluation ids come from a module counter; next() on it is cheaper than
+# the class-attribute increment it replaces
+_EVAL_ID = itertools.count()
+
+def reset_evaluation_ids():
+    '''restart evaluation ids, used when a fresh generation pass begins'''
+    global _EVAL_ID
+    _EVAL_ID = itertools.count()
+
 class EvaluatedObject:
     '''
     An evaluation of set of a option blocks
     '''
-    creation_count = 0
-    
+
     __slots__ = (
         "failed_options", "successful_options", "blocks", "total_students",
-        "evaluated", "success_percentage", "paths_enabled", "id", "unhandled_students"
+        "evaluated", "success_percentage", "paths_enabled", "id", "unhandled_students",
+        "_hash"
     )
     
     def __init__(self) -> None:
@@ -40,12 +63,17 @@ class EvaluatedObject:
         self.evaluated = False
         self.success_percentage:float = 0
         self.paths_enabled = True
-        self.id = EvaluatedObject.creation_count
+        self.id = next(_EVAL_ID)
         self.unhandled_students = {}
-        EvaluatedObject.creation_count += 1
-        
+        self._hash = None
+
     def __hash__(self) -> int:
-        return hash(tuple(map(tuple, self.blocks)))
+        # blocks are fixed once the evaluation completes, so the expensive
+        # tuple-of-tuples hash only needs computing once
+        h = self._hash
+        if h is None:
+            h = self._hash = hash(tuple(map(tuple, self.blocks)))
+        return h
     
     def __eq__(self, __value: object) -> bool:
         if not isinstance(__value, self.__class__):
@@ -59,7 +87,7 @@ class EvaluatedObject:
         """
         pretty print evaluation to stdout
         """
-        print(f"\nTotal generation statistics ID[{EvaluatedObject.creation_count}]:")
+        print(f"\nTotal generation statistics ID[{self.id}]:")
         print("\nTotal options : %i" % self.total_students)
         print("Successful options : %i" % len(self.successful_options))
         print("Failed options : %i" % len(self.failed_options))
@@ -82,6 +110,19 @@ class EvaluatedObject:
         '''
         calculates the number of students per class in this given set of option blocks
         '''
+        if sentinel is None:
+            # bulk path: aggregate identical (code, block) placements so
+            # each class is only retrieved and written once
+            counts = Counter()
+            for student in self.successful_options.values():
+                counts.update(student.options)
+            retrieve = self.blocks.retrieve
+            for (code, block), occurrences in counts.items():
+                retrieve(block-1, code).increment_students(occurrences)
+            return self
+
+        # sentinel capping depends on per-student order, so keep the
+        # original walk when one is set
         for student_id, student in self.successful_options.items():
             for code, block in student.options:
                 klass = self.blocks.retrieve(block-1, code)
@@ -90,22 +131,22 @@ class EvaluatedObject:
                     klass.students = sentinel
                 else:
                     klass.increment_students()
-                
+
         return self
     
 from multiprocessing import Pool
 from dataclasses import dataclass
 
-@dataclass
+@dataclass(slots=True)
 class Student:
-    
+
     options: list
     pathway: pathways.BasePathway
-    
+
     priorties: list = None
     exceptions: List[Exception] = None
-    
-@dataclass
+
+@dataclass(slots=True)
 class FailedStudent:
     options: list
     pathway: pathways.BasePathway
@@ -145,59 +186,119 @@ class EvaluationUtility:
         try a set of options against the given set of blocks. set order
         to false to prioritise the initial order instead of automatically ordering.
         '''
-        # deep copy blocks and options as we are going to be manipulating them
-        # but we need to make sure we still have an untouched version for other options
-        blocks = copy.deepcopy(blocks)
-        options = copy.copy(options)
+        # validate once up front rather than on every zero-count hit, and
+        # survive python -O unlike the assert this replaces
+        if prioritise is not None and not isinstance(prioritise, int):
+            raise TypeError("prioritise must be an integer")
+        # build a subject -> block-bitmask index and track still-usable
+        # blocks in a single int, so placement is a mask intersection
+        # instead of a scan over every block. Nothing mutates the caller's
+        # blocks any more, so no defensive copy is needed.
+        # the counts dict also keeps the original option order, built once
+        # here and maintained incrementally as blocks are retired
+        locations = {}
+        active = 0
+        for block, subjects in enumerate(blocks):
+            if subjects is None:
+                continue
+            bit = 1 << block
+            active |= bit
+            for subject in subjects:
+                locations[subject] = locations.get(subject, 0) | bit
+        counts = statistics.subject_block_count(dict.fromkeys(options), blocks)
         # order blocks by number of available subjects
-        required_iters = len(options)
+        required_iters = len(counts)
         current_iters = 0
-        handled = []
+        handled = [None] * required_iters
+        matched = 0
         # iterate until the length of subjects have been dealt with
         while current_iters < required_iters:
-            counts = statistics.subject_block_count(options, blocks)
             # decide whether to order the counts or not. We want to do this
             # when prioritising a level of choices by original order
             if order:
-                subject, count = [
-                    (subj,occ) for subj, occ in sorted(counts.items(), key=lambda x:x[1])
-                    ][0]
+                subject, count = min(counts.items(), key=itemgetter(1))
             else:
-                subject, count = list(counts.items())[0]
+                subject, count = next(iter(counts.items()))
             if count == 0:
                 # if the count is 0, it means that the option could not be found in
                 # the option blocks. This could be due to another subject already
                 # taking up an option block.
-                if prioritise is not None:
-                    assert type(prioritise) is int, "prioritise must be an integer"
-                    if prioritise > len(handled):
-                        raise exceptions.PriorityFailed(
-                            "unable to match options against priority level")
+                if prioritise is not None and prioritise > matched:
+                    raise exceptions.PriorityFailed(
+                        "unable to match options against priority level")
                 if raise_exceptions:
                     raise exceptions.EvaluationFailed(
                         "%s could not be evaluated" % subject,
                     )
-            # iterate through each block and try and insert the subject
-            for block, subjects in enumerate(blocks):
-                # check that the block has not already been dealt with
-                if subjects is not None and type(subjects) is list:
-                    if subject in subjects:
-                        # if the subject is found, we have dealt with a subject
-                        # and we need to set the block we found it in to be unusable
-                        # and get detail about what we did with the subject
-                        handled.append((
-                            subject,
-                            block+1
-                        ))
-                        blocks[block] = None
-                        break
-
-            options.remove(subject)
+            # place the subject in its first still-active block, if any
+            retired = None
+            found = locations.get(subject, 0) & active
+            if found:
+                # lowest set bit matches the old first-block scan order
+                bit = found & -found
+                block = bit.bit_length() - 1
+                handled[matched] = (subject, block+1)
+                matched += 1
+                retired = blocks[block]
+                active &= ~bit
+
+            del counts[subject]
+            if retired is not None:
+                # every pending option in the retired block loses one
+                # candidate, saving a full recount next iteration
+                for other in retired:
+                    if other in counts:
+                        counts[other] -= 1
             current_iters += 1
 
         if raise_exceptions:
             # saftey net
-            assert len(handled) == required_iters, "unmatched handled subjcts"
+            assert matched == required_iters, "unmatched handled subjcts"
+        elif matched != required_iters:
+            del handled[matched:]
+        return handled
+
+    @functools.lru_cache(maxsize=8)
+    def _block_index(self, blocks_key:Tuple[tuple]):
+        # inverted index mapping each subject to a bitmask of the blocks
+        # it appears in, built once per block layout instead of rescanning
+        # every block for every student
+        index:Dict[str, int] = {}
+        for block, subjects in enumerate(blocks_key):
+            bit = 1 << block
+            for subject in subjects:
+                index[subject] = index.get(subject, 0) | bit
+        return index
+
+    @functools.lru_cache(maxsize=4096)
+    def _try_against_blocks_cached(self, blocks_key:Tuple[tuple], options_key:Tuple[str]):
+        # many students share the same option set, so matching results
+        # against a fixed set of blocks can be reused wholesale. This is
+        # the bitmask equivalent of try_against_blocks(order=True): pick
+        # the scarcest subject, place it in its first free block, retire
+        # that block and repeat
+        index = self._block_index(blocks_key)
+        available = (1 << len(blocks_key)) - 1
+        remaining = list(options_key)
+        handled = []
+        while remaining:
+            best = None
+            best_count = None
+            for subject in remaining:
+                count = (index.get(subject, 0) & available).bit_count()
+                if best_count is None or count < best_count:
+                    best = subject
+                    best_count = count
+            if best_count == 0:
+                raise exceptions.EvaluationFailed(
+                    "%s could not be evaluated" % best,
+                )
+            # lowest set bit is the first block still holding the subject,
+            # matching the scan order of try_against_blocks
+            bit = (index[best] & available) & -(index[best] & available)
+            handled.append((best, bit.bit_length()))
+            available &= ~bit
+            remaining.remove(best)
         return handled
 
     def get_pathway(self, options:List[str]):
@@ -224,6 +325,9 @@ class EvaluationUtility:
         # we know that these options will not evaluate sucessfully but we
         # can at least priorities a certain number of subjects that are in
         # order
+        if not level:
+            # nothing to prioritise, so skip the re-match entirely
+            return []
         try:
             return self.try_against_blocks(
                 blocks=blocks,
@@ -249,41 +353,61 @@ class EvaluationUtility:
         evaluation = EvaluatedObject()
         evaluation.total_students = len(self.cache.data)
         evaluation.paths_enabled = self.calculate_pathways
+        # blocks are fixed for the whole evaluation, so key the match cache
+        # on them once up front
+        blocks_key = tuple(map(tuple, blocks))
+        # hoist the per-student lookups out of the loop; each attribute
+        # access would otherwise be repeated for every student
+        _try = self._try_against_blocks_cached
+        _pathway = self.get_pathway
+        _prioritise = self.prioritise_failed
+        successful = evaluation.successful_options
+        failed = evaluation.failed_options
+        failed_priority = self.options.get("failed_priority")
+        # pathways only depend on the option set, which many students
+        # share, so resolve each distinct set once
+        pathway_cache = {}
+        unset = object()
         # iterate through each set of student options
         for key, student_options in self.cache.data.items():
+            options_key = tuple(student_options)
+            pathway = pathway_cache.get(options_key, unset)
+            if pathway is unset:
+                pathway = pathway_cache[options_key] = _pathway(student_options)
             try:
-                opts = self.try_against_blocks(blocks, student_options)
-                pathway = self.get_pathway(student_options) 
-                
-                evaluation.successful_options.update({
-                    key: Student(opts, pathway)
-                })
+                opts = _try(blocks_key, options_key)
+                successful[key] = Student(opts, pathway)
             except exceptions.EvaluationFailed as failure:
                 # if the evaluation failed, log why it failed
                 errors = [failure]
-                prioritised = self.prioritise_failed(
-                    blocks, 
-                    student_options,
-                    level=self.options.get("failed_priority")
-                    )
+                prioritised = None
+                if failed_priority:
+                    # the prioritised re-match is purely diagnostic, so
+                    # only pay for it when a priority level is configured
+                    prioritised = _prioritise(
+                        blocks,
+                        student_options,
+                        level=failed_priority
+                        )
 
-                if isinstance(prioritised, exceptions.EvaluationFailed):
-                    errors.append(prioritised)
-                    prioritised = None
-                evaluation.failed_options.update({ 
-                    key: Student(
-                        options=student_options,
-                        pathway=self.get_pathway(student_options),
-                        priorties=prioritised,
-                        exceptions=errors
-                    )}
+                    if isinstance(prioritised, exceptions.EvaluationFailed):
+                        errors.append(prioritised)
+                        prioritised = None
+                failed[key] = Student(
+                    options=student_options,
+                    pathway=pathway,
+                    priorties=prioritised,
+                    exceptions=errors
                 )
+        self._try_against_blocks_cached.cache_clear()
         evaluation._set_success_percentage()
         evaluation.blocks = OptionBlocks(blocks, self.cache)
+        evaluation._hash = None
         # set evaluated flag to true to ensure all processes have been completed
         evaluation.evaluated = True
         self.cache.logger.output(
-            "evaluation finished for '%s' with success rate '%f'" % (evaluation.id, evaluation.success_percentage),
+            "evaluation finished for '%s' with success rate '%f'",
+            evaluation.id, evaluation.success_percentage,
             level="debug",
             grouping="evaluation"
             )
@@ -292,7 +416,8 @@ class EvaluationUtility:
     def multiprocess_states(self, states: Iterable[statistics.State]) -> Iterable[EvaluatedObject]:
         '''
         multiprocess states if the length of states passes a given threshold and is enabled. It will use
-           .process_states() if it does not need to use multiprocessing.        
+           .process_states() if it does not need to use multiprocessing. Results are streamed
+        as workers finish so callers can start aggregating early.
         '''
         if (
             len(states) > config.Config.getint("evaluation-threshold", fallback=MULTIPROCESS_THRESHOLD) 
@@ -300,18 +425,32 @@ class EvaluationUtility:
             and config.Config.getbool("evaluation-multiprocessing", fallback=True)
             ):
             
-            with Pool(initializer=initializer) as pool:
-                self.cache.within_deamon = True
+            # size the pool to the work available and hand each worker a
+            # batch of states per round-trip instead of one at a time
+            processes = min(os.cpu_count() or 1, len(states))
+            chunksize = max(1, len(states) // (processes * 4))
+            # flag before the pool is created so the pickled utility the
+            # workers receive already carries it
+            self.cache.within_deamon = True
+            with Pool(
+                processes=processes, initializer=_worker_init, initargs=(self,)
+                ) as pool:
                 try:
                     self.cache.logger.output("using multiprocessing", level="fatal")
-                    return pool.map(self.evaluate_state, self.cache.generated_states)  
+                    # tasks only carry the raw blocks; the utility and its
+                    # cache already live in each worker. Callers do not
+                    # depend on ordering, so stream whatever finishes first
+                    yield from pool.imap_unordered(
+                        _worker_evaluate_blocks,
+                        [state.blocks for state in states],
+                        chunksize=chunksize
+                        )
                 except KeyboardInterrupt:
                     pool.terminate()
                     pool.join()
                     logging.logger.fatal("multiprocessing states was manually terminated")
-                    return []
         else:
-            return self.process_states(states)
+            yield from self.process_states(states)
 
     
     def process_states(self, states: Iterable[statistics.State]):
@@ -18,31 +18,31 @@ class LinearBranch:
     def __init__(self, nodes: List[Operation]) -> None:
         self.nodes = nodes
         self.branch_id = None
-        
-        self._applied_states = []
-        
+
+        self._final_state = None
+
     def __str__(self) -> str:
         return "%s[%i]" % (self.branch_id, len(self.nodes))
-        
+
     def apply(self, blocks: OptionBlocks):
         '''
         apply the set of operations on a given set of blocks
         '''
         if blocks is None:
             raise TypeError("cannot except non-type")
-        changes = []
+        # only the end result is ever read back, so do not keep every
+        # intermediate snapshot alive
         for operation in self.nodes:
             blocks = operation.forwards(blocks)
-            changes.append(blocks)
-        self._applied_states = changes
-    
-        
+        self._final_state = blocks
+
+
     def get_final_state(self) -> OptionBlocks:
         '''
         get completed state after all operations have been applied
         '''
-        assert len(self._applied_states) > 0, ".apply() must be called"
-        return self._applied_states[-1]
+        assert self._final_state is not None, ".apply() must be called"
+        return self._final_state
     
     def pprint(self):
         '''pretty print all nodes to execute in order'''
@@ -138,22 +138,31 @@ class Operation:
         '''
         get operations of a specific branch connected to this operation
         '''
+        # walk the chain iteratively; the recursive version built a new
+        # intermediate list per hop and risked the recursion limit on
+        # long branches
+        collected = []
         operation = self.connections.get(name)
-        if operation is None:
-            return []
-        return [operation] + operation.get_branch(name)            
-        
+        while operation is not None:
+            collected.append(operation)
+            operation = operation.connections.get(name)
+        return collected
+
     def merge(self, name:str, new_branch:str):
         '''
         set all operations with the given branch 'name' to a 'new_branch'.
         '''
-        operation = self.connections.get(name)
-        if operation is None:
-            return []
-        operation.branch_id = new_branch
-        self.connections.pop(name)
-        self.connections[new_branch] = operation
-        return [operation] + operation.merge(name, new_branch)            
+        collected = []
+        current = self
+        operation = current.connections.get(name)
+        while operation is not None:
+            operation.branch_id = new_branch
+            current.connections.pop(name)
+            current.connections[new_branch] = operation
+            collected.append(operation)
+            current = operation
+            operation = current.connections.get(name)
+        return collected
 
     
 class _InitialOperation(Operation):
@@ -1,5 +1,8 @@
 from typing import Dict, List
 
+from collections import Counter
+import functools
+
 from obg.core.exceptions import PathwayFailed
 
 # ebacc = {
@@ -8,6 +11,15 @@ from obg.core.exceptions import PathwayFailed
 #   languages : [...],
 # }
 
+@functools.lru_cache(maxsize=8)
+def _category_sets(items:tuple):
+    # the ebacc mapping rarely changes within a session, so every pathway
+    # built from the same categories shares one set of frozensets
+    sets = {category: frozenset(subjects) for category, subjects in items}
+    union = frozenset().union(
+        sets.get("sciences", ()), sets.get("humanities", ()), sets.get("languages", ()))
+    return sets, union
+
 class BasePathway:
     '''
     calling an instance of a pathway validates it and if successful, returns the
@@ -23,6 +35,12 @@ class BasePathway:
         self.humanities:List = self.get_category("humanities")
         self.languages:List = self.get_category("languages")
         self.vocational:List = self.get_category("vocational")
+        # frozenset views so validation does O(1) membership tests instead
+        # of scanning (and re-concatenating) the category lists per call
+        self._cat_sets, self._ebacc_set = _category_sets(tuple(sorted(
+            (category, tuple(sorted(subjects)))
+            for category, subjects in ebacc_subjects.items()
+            )))
         self.pathway_name = self.__class__.__name__
 
     def __str__(self) -> str:
@@ -37,7 +55,8 @@ class BasePathway:
     def get_category(self, category:str):
         subjects = self.ebacc.get(category, None)
         assert subjects is not None, "could not find '%s' category in ebacc subjects" % category
-        assert type(subjects) is list, "subjects value for '%s' must be type list" % category
+        assert isinstance(subjects, (list, frozenset, set)), \
+            "subjects value for '%s' must be a list or set" % category
         return subjects
 
     
@@ -61,12 +80,16 @@ class PathOne(BasePathway):
         
         # 1) Hi, Ge, 1) Fr, Sn
         
-        check = dict.fromkeys(["languages","humanities"], False)
+        languages = self._cat_sets["languages"]
+        humanities = self._cat_sets["humanities"]
+        has_language = False
+        has_humanity = False
+        # accumulate with |= so each option costs two set probes and no
+        # branches
         for option in options:
-            for category in check.keys():
-                if option in self.get_category(category):
-                    check[category] = True
-        if not all(check.values()):
+            has_language |= option in languages
+            has_humanity |= option in humanities
+        if not (has_language and has_humanity):
             raise PathwayFailed
 
 class PathTwo(BasePathway):
@@ -85,11 +108,7 @@ class PathTwo(BasePathway):
         # eligible for this route
         
         # ONLY ONE EBACC
-        ebacc = False
-        for option in options:
-            if option in self.sciences + self.humanities + self.languages:
-                ebacc = True
-        if ebacc is False:
+        if not any(option in self._ebacc_set for option in options):
             raise PathwayFailed
 
 
@@ -147,11 +166,8 @@ class Pathways:
         '''
         return a dictionary with the popularity of each pathway
         '''
-        items = dict.fromkeys(Pathways.DEFAULT_PATHWAYS, 0)
-        for path in self.pathways.values():
-            current = items[path.__class__]
-            items[path.__class__] = current + 1
-        return items
+        counts = Counter(path.__class__ for path in self.pathways.values())
+        return {klass: counts.get(klass, 0) for klass in Pathways.DEFAULT_PATHWAYS}
     
     def serialized_groups(self):
         '''
@@ -174,17 +190,17 @@ def pathway_popularity(data:Dict[str, list], ebacc):
     '''
     calculate the populairty of each subject from the data given
     '''
-    pathways = DEFAULT_PATHWAYS.copy()
-    counts = dict.fromkeys(map(lambda x:x.__name__, pathways), 0)
+    # build each pathway once; constructing them per student repeated the
+    # category lookups and assertions for no benefit
+    instances = [possible_path(ebacc) for possible_path in DEFAULT_PATHWAYS]
+    counts = dict.fromkeys((path.pathway_name for path in instances), 0)
     for options in data.values():
         path = None
-        for possible_path in pathways:
+        for possible_path in instances:
             try:
-                path = possible_path(ebacc)
-                path(*options)
+                path = possible_path(*options)
                 break
             except PathwayFailed:
                 pass
-        current = counts[path.__class__.__name__]
-        counts[path.__class__.__name__] = current + 1
+        counts[path.pathway_name] += 1
     return counts
\ No newline at end of file
@@ -33,11 +33,17 @@ class Process:
         raise NotImplementedError()
     
     def after_process(self):
-        self.cache.logger.output(
-            "proccess %s [%s] successful" % (hash(self.state.id), self.__class__.__name__),
-            level="info",
-            grouping="process_completion"
-            )
+        # check the grouping first so the argument building (hash included)
+        # is skipped when nothing would be emitted; this runs once per
+        # executed process
+        log = self.cache.logger
+        if log.enabled("process_completion"):
+            log.output(
+                "proccess %s [%s] successful",
+                hash(self.state.id), self.__class__.__name__,
+                level="info",
+                grouping="process_completion"
+                )
     
     @property
     def process_id(self):
@@ -107,7 +113,10 @@ class RemainingPairs(Process):
     def ready_cache(self):
         if self.process_cache is None:
             singles = statistics.filter_classes(self.state.classes, value=1)
-            remaining = set(self.state.used).symmetric_difference(singles.keys())
+            # single-class subjects that have not been placed yet. The old
+            # symmetric_difference also swept in used subjects that were
+            # not singles, re-running auto_populate over them for nothing
+            remaining = singles.keys() - self.state.used
             if self.cache.protocol.is_using(protocols.OrderSetProtocol):
                 remaining = sorted(remaining)
                 
@@ -126,10 +135,17 @@ class MainProcess(Process):
             self.process_cache = dict()
             
     def run_process(self):
-        # do not repeat the proccess for single classes or negligible
+        # do not repeat the proccess for single classes or negligible.
+        # bucket subjects by their class count once instead of rescanning
+        # the whole classes dict for every usage level; auto_populate
+        # drains a subject's count in one go, so the snapshot matches what
+        # the per-level filter would have seen
+        buckets = {}
+        for subject, count in self.state.classes.items():
+            buckets.setdefault(count, []).append(subject)
         for use in reversed(range(1, len(self.state.blocks))):
 
-            for subject in statistics.filter_classes(self.state.classes, use):
+            for subject in buckets.get(use, ()):
                 self.state.auto_populate(
                     subject=subject,
                     iterations=use
@@ -151,4 +167,4 @@ class Negligible(Process):
    
 
         
-PROCESSES = [PriorityPairs, RemainingPairs, MainProcess, Negligible]
\ No newline at end of file
+PROCESSES = (PriorityPairs, RemainingPairs, MainProcess, Negligible)
\ No newline at end of file
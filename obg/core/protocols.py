@@ -64,22 +64,32 @@ class chain_protocols:
     '''
     def __init__(self, *protocols) -> None:
         self.protocols = list(protocols)
+        self._by_type = {}
         for protocol in self.protocols:
             if not isinstance(protocol, Protocol):
                 raise TypeError("invalid protocol '%s'" % protocol)
             setattr(self, protocol.name, protocol)
-        
+            self._register(protocol)
+
+    def _register(self, protocol: Protocol):
+        # index the protocol under every Protocol class in its mro so
+        # is_using becomes a single dict probe; setdefault keeps the
+        # first-match behaviour of the old isinstance scan
+        for klass in type(protocol).__mro__:
+            if issubclass(klass, Protocol):
+                self._by_type.setdefault(klass, protocol)
+
     def is_using(self, protocol: Protocol):
-        for i in self.protocols:
-            if isinstance(i, protocol):
-                return i
-        return None
-    
+        return self._by_type.get(protocol)
+
     def __and__(self, __o):
         if isinstance(__o, chain_protocols):
             self.protocols.extend(__o.protocols)
+            for protocol in __o.protocols:
+                self._register(protocol)
             return self
         elif isinstance(__o, Protocol):
             self.protocols.append(__o)
+            self._register(__o)
             return self
         raise TypeError("can only add protocol objects")
\ No newline at end of file
@@ -1,6 +1,9 @@
 # methods for matching and subject clashing
 
+from collections import Counter
 from itertools import combinations, chain
+import heapq
+import sys
 from typing import Any, Dict, Iterable, List, Tuple, Callable, Set
 
 import copy
@@ -16,14 +19,37 @@ def clash_count(subjects:Iterable, data:Dict[Any,List]):
     exist in student's choices. e.g. checking Fr, Ge will return a count where
     Fr and Ge BOTH exist in a student's choices
     '''
+    target = set(subjects)
+    if len(target) != len(subjects):
+        # a repeated subject can never match that many distinct options
+        return 0
     count = 0
     for student_options in data.values():
-        matched = sum([1 for subj in set(subjects) if subj in student_options])
-        if matched == len(subjects):
+        if target.issubset(student_options):
             count += 1
     return count
         
 
+def clash_count_mask(pair_mask:int, masks:List[int]):
+    '''
+    mask-based clash_count: counts students whose bit-packed options
+    contain every subject folded into pair_mask
+    '''
+    return sum(1 for mask in masks if mask & pair_mask == pair_mask)
+
+def count_all_pairs(masks:List[int], pair_masks:List[int]) -> List[int]:
+    '''
+    batched clash_count_mask: count every pair mask across all students,
+    touching each student mask once instead of once per pair
+    '''
+    counts = [0] * len(pair_masks)
+    items = list(enumerate(pair_masks))
+    for mask in masks:
+        for pos, pair in items:
+            if mask & pair == pair:
+                counts[pos] += 1
+    return counts
+
 def clash_matrix(option_codes:List):
     '''
     generates a clash matrix
@@ -33,19 +59,36 @@ def clash_matrix(option_codes:List):
         clashes.append(tuple(sorted(comparission)))
     return clashes
 
+def pair_clash_counts(data:Dict[Any, List]) -> Counter:
+    '''
+    count every pair of subjects chosen together, in a single pass over
+    the students. Pairs are stored sorted, matching clash_matrix order
+    '''
+    pairs = Counter()
+    for student_options in data.values():
+        pairs.update(combinations(sorted(set(student_options)), 2))
+    return pairs
+
 def evalute_clashes(clashes:set, data:Dict[Any, List]):
     '''
     returns a dictionary of clashes and their counts
     '''
-    # essentially, we go through each clash from a set of clashes
-    # and check each students option's to see how often it clashes
-    return {clash:clash_count(clash, data) for clash in clashes}
+    # count all co-occurring pairs once, then read each requested clash
+    # off the table instead of rescanning every student per pair
+    pairs = pair_clash_counts(data)
+    return {
+        clash: pairs[tuple(sorted(clash))] if len(clash) == 2
+        else clash_count(clash, data)
+        for clash in clashes
+        }
 
 def order_clashes(clashes:Dict[Tuple, int], reverse=True):
     '''
     order a dictionary of clashes by the number of clashes
     '''
-    return {clashes:value for clashes, value in sorted(clashes.items(), key=lambda x:x[1], reverse=reverse)}
+    # sorted() already yields (key, value) pairs, so dict() consumes them
+    # directly without rebuilding through a comprehension
+    return dict(sorted(clashes.items(), key=operator.itemgetter(1), reverse=reverse))
 
 def filter_clashes(clashes:Dict[Tuple, int], predicate:Callable=None):
     '''
@@ -77,33 +120,32 @@ def subject_block_count(option_codes:List[str], blocks:List[List[str]]):
     '''
     counts = dict.fromkeys(option_codes, 0)
 
-    for option in option_codes:
-        value = counts.get(option, None)
-        occurances = 0
-        for block in blocks:
-            if block is None:
-                continue
-            if option in block:
-                occurances += 1
-        counts[option] = value + occurances
+    # walk each block once instead of scanning every block per option;
+    # blocks never hold a subject twice so occurrence and membership
+    # counts coincide
+    for block in blocks:
+        if block is None:
+            continue
+        for option in block:
+            if option in counts:
+                counts[option] += 1
     return counts
 
 def calculate_classes(popularity:Dict[str, int],*, class_size:int, maximum=None) -> Dict[str, int]:
     '''
     returns a dict of {subject_code:classes_for_subject} for each of the subject counts.
     '''
-    results = {}
-    for subj_code, count in popularity.items():
-        classes = 0
-        if classes == class_size:
-            classes = 1
-        else:
-            classes = (int(count) // class_size) + 1
-        # set max if given
-        if maximum and classes > maximum:
-            classes = maximum
-        results[subj_code] = classes
-    return results
+    # the old loop carried a dead `classes == class_size` branch that
+    # could never fire; the live arithmetic is a floor division and clamp
+    if maximum:
+        return {
+            subj_code: min(int(count) // class_size + 1, maximum)
+            for subj_code, count in popularity.items()
+            }
+    return {
+        subj_code: int(count) // class_size + 1
+        for subj_code, count in popularity.items()
+        }
 
 import operator
 
@@ -127,28 +169,74 @@ class Cache:
     '''
     
     def __init__(self, data: Dict[Any, Iterable], option_codes: Iterable[str]) -> None:
-        self.data = data
+        # intern every option string once at ingest so the hot loops below
+        # (dict probes, set membership, equality in clash counting) compare
+        # codes by identity against their cached hashes rather than
+        # rehashing character data per lookup
+        self.data = {
+            student: tuple(map(sys.intern, options))
+            for student, options in data.items()
+            }
         self.option_codes = option_codes
+        # stable integer id per option code, used for bitmask membership tests
+        self.option_id = {sys.intern(code): i for i, code in enumerate(sorted(option_codes))}
         self.popularity = {}
         self.protocol: Protocol = None
         self.generated_states = set()
+        # one-slot last-seen cache in front of generated_states; repeat
+        # completions of the same state skip the set probe entirely
+        self._last_state: State = None
         self.process_cache = dict()
         self.within_deamon = False
         self.debug_options = {}
         self.logger: Log = None
         self.Ebacc = None
-        
-        # extra settings 
+        self.Ebacc_any = None
+        # bit-packed student choices, built lazily as data may not be
+        # validated yet when the cache is constructed
+        self._student_masks = None
+
+        # extra settings
         self._options = {}
+
+    def mark_generated(self, state):
+        '''
+        record a completed state, checking the last state seen before
+        touching the real set
+        '''
+        last = self._last_state
+        if last is not None and last._hash == state._hash and last == state:
+            return
+        self._last_state = state
+        self.generated_states.add(state)
+
+    def student_masks(self) -> List[int]:
+        '''
+        returns each student's options folded into an int over option_id,
+        so multi-subject membership tests become single AND operations
+        '''
+        masks = self._student_masks
+        if masks is None:
+            option_id = self.option_id
+            masks = []
+            for student_options in self.data.values():
+                mask = 0
+                for subject in student_options:
+                    mask |= 1 << option_id[subject]
+                masks.append(mask)
+            self._student_masks = masks
+        return masks
         
     def copy(self):
-        data = copy.deepcopy(self.data)
-        option_codes = copy.copy(self.option_codes)
-        new = self.__class__(data, option_codes)
+        # data and option codes are read-only after ingestion (ingest
+        # freezes the option lists to tuples), so share them instead of
+        # deep-copying every student's choices
+        new = self.__class__(self.data, self.option_codes)
         new.popularity = self.popularity
-        
-        
-                
+        return new
+
+
+
 class CachedStats:
     '''
     object that calculates clashes between subjects. 
@@ -156,26 +244,31 @@ class CachedStats:
     # an object is used to allow for caching 
     def __init__(self, cache: Cache) -> None:
         self.data = cache.data
-        self._cache = {}
+        self.source = cache
+        # every pair the data can produce, filled in one pass on first use
+        self._pairs: Counter = None
+
+    def _pair_counts(self) -> Counter:
+        pairs = self._pairs
+        if pairs is None:
+            pairs = self._pairs = pair_clash_counts(self.data)
+        return pairs
 
     def subject_block_clashes(self, subject_code:str, block:List) -> int:
         '''
-        similar to 'subject_block_clashes' but caches using a given dictionary and returns the clash
-        count and a dictionary that has not yet been cahed
+        sums the clash counts between a subject and every subject in a
+        block, read straight off the precomputed pair table
         '''
+        pairs = self._pair_counts()
         clashes = 0
         for subject in block:
-            # sort the clash as, when we are using a clash matrix, the clashes will be ordered
-            # by alphabetical order. We need to do this to cache properly and find the correct
-            # cached value if it exists
-            clash = tuple(sorted((subject, subject_code)))
-            cached = self._cache.get(clash, None)
-            if cached is None:
-                count = clash_count(clash, self.data)
-                self._cache.update({clash:count})
-                clashes += count
-            else:
-                clashes += cached
+            # pairs are stored sorted, matching clash_matrix order; a pair
+            # of the same code never matches a student twice
+            if subject != subject_code:
+                clashes += pairs[
+                    (subject, subject_code) if subject < subject_code
+                    else (subject_code, subject)
+                    ]
         return clashes
 
     def total_block_count(self, subject_code:str, blocks:List[List]) -> List[int]:
@@ -193,7 +286,7 @@ class CachedStats:
         return clash_counts
     
     def clear_cache(self):
-        self._cache = {}
+        self._pairs = None
         
     
 
@@ -224,7 +317,9 @@ class clean:
         
 
 def to_dict(data:List[List[str]], predicate: Callable=_pred):
-    return {key: predicate(value) for key, value in enumerate(data)}
+    # options are frozen to tuples so downstream consumers can safely
+    # share the ingested data without copying it
+    return {key: tuple(predicate(value)) for key, value in enumerate(data)}
 
 import uuid
 
@@ -232,24 +327,61 @@ def to_dict_uuid(data:List[List[str]], predicate: Callable=_pred):
     '''
     attaches uuid4 to each item
     '''
-    return {uuid.uuid4(): predicate(value) for value in data}
+    return {uuid.uuid4(): tuple(predicate(value)) for value in data}
+
+def to_dict_uuid_validated(data:List[List[str]], allowed:Iterable[str], max_options:int=None, predicate: Callable=_pred):
+    '''
+    same as 'to_dict_uuid' but validates each set of options while the
+    dictionary is built, saving the separate validation pass that
+    Generator.check_data would otherwise make over the same data
+    '''
+    allowed = frozenset(allowed)
+    result = {}
+    for value in data:
+        options = tuple(predicate(value))
+        if max_options is not None and len(options) > max_options:
+            raise exceptions.ValidationError(
+                "'%s' has a number of options that exceeds the maximum number of blocks" % (options,)
+            )
+        if not allowed.issuperset(options):
+            bad = set(options) - allowed
+            raise exceptions.ValidationError(
+                "invalid option '%s'" % bad.pop()
+            )
+        result[uuid.uuid4()] = options
+    return result
 
 def to_list(data:List[str], predicate: Callable=_pred):
     return [predicate(i) for i in data]
 
 
         
+import random
+
+# random salt per (subject, block index) pair, folded into State hashes so
+# they update in O(1) per insert instead of rehashing every block
+_HASH_SALTS: Dict[Tuple[str, int], int] = {}
+
+def _insert_salt(subject:str, index:int) -> int:
+    salt = _HASH_SALTS.get((subject, index))
+    if salt is None:
+        salt = _HASH_SALTS[(subject, index)] = random.getrandbits(64)
+    return salt
+
+
 class State:
-    
+
     creation_counter = 0
-    
+
     __slots__ = (
-        'blocks', 'classes', 'together', 'current_process', 'process_index',
-        'cache', 'stats', 'id', 'allow_branching', 'used'
+        'blocks', 'masks', 'classes', 'together', 'current_process', 'process_index',
+        'cache', 'stats', 'id', 'allow_branching', 'used', '_hash', '_clash_table'
         )
-    
+
     def __init__(self) -> None:
         self.blocks: List[List[str]] = list()
+        # per-block bitmasks over cache.option_id for O(1) membership tests
+        self.masks: List[int] = list()
         # keeps track of the number of classes a subject still has 
         self.classes: Dict[str, int] = dict()
         self.together: Dict[str, Dict[str,int]] = dict()
@@ -263,30 +395,44 @@ class State:
         self.stats: CachedStats = None
         
         self.allow_branching = True
-        
+        self._hash = 0
+        # per-subject clash counts per block, kept current by raw_insert
+        self._clash_table: Dict[str, List[int]] = None
+
         self.id = self.__class__.creation_counter
         self.__class__.creation_counter = self.id + 1
-        
+
     def __hash__(self) -> int:
-        # how 'unique' a node will depend on the blocks it currently has
-        return hash(tuple(map(tuple, self.blocks)))
+        # how 'unique' a node will be depends on the blocks it currently
+        # has; the salts XORed in by raw_insert mean two states hash equal
+        # exactly when they hold the same subjects in the same blocks
+        return self._hash
     
     def __eq__(self, __o: object) -> bool:
         if not isinstance(__o, State):
             raise TypeError(
                 "can only compare 'State' instances with each other"
             )
-        return __o.blocks == self.blocks
+        # equal blocks always produce equal incremental hashes, so a
+        # mismatch rules out equality before walking the block lists
+        return __o._hash == self._hash and __o.blocks == self.blocks
         
                 
     def __str__(self) -> str:
         return "StateObject[%i]" % State.creation_counter
     
     def copy(self):
-        new = self.__class__()
-        new.blocks = copy.deepcopy(self.blocks)
-        new.classes = copy.deepcopy(self.classes)
-        new.together = copy.deepcopy(self.together)
+        # bypass __init__: every slot is assigned below, so running it
+        # first only built containers that were immediately thrown away.
+        # copying happens on every branch
+        new = State.__new__(State)
+        # blocks hold immutable strings and together holds ints one level
+        # down, so per-container copies match deepcopy without its
+        # recursive dispatch
+        new.blocks = [list(block) for block in self.blocks]
+        new.masks = list(self.masks)
+        new.classes = dict(self.classes)
+        new.together = {key: dict(value) for key, value in self.together.items()}
         new.used = self.used.copy()
         
         new.current_process = self.current_process
@@ -296,8 +442,19 @@ class State:
         new.stats = self.stats
         
         new.allow_branching = self.allow_branching
-        
+        new._hash = self._hash
+        table = self._clash_table
+        new._clash_table = (
+            {subject: list(row) for subject, row in table.items()}
+            if table else None
+            )
+
+        new.id = State.creation_counter
+        State.creation_counter = new.id + 1
+
         return new
+
+    __copy__ = copy
     
     # insertion methods
     
@@ -307,19 +464,32 @@ class State:
         '''
         assert index >= 0, "value must be greater than 0"
         assert index < len(self.blocks), "greater than number of blocks"
-        block = self.blocks[index]
         usage = self.classes.get(subject, None)
         if usage is None:
             raise exceptions.SubjectNotFound(
                 "unknown subject '%s' is trying to be inserted" % subject
             )
-        if subject in block:
+        bit = 1 << self.cache.option_id[subject]
+        if self.masks[index] & bit:
             raise exceptions.SubjectAlreadyExists(
-                "'%s' already exists in block index '%s'" % (subject, block)
+                "'%s' already exists in block index '%s'" % (subject, self.blocks[index])
             )
         self.used.add(subject)
         self.blocks[index].append(subject)
+        self.masks[index] |= bit
+        self._hash ^= _insert_salt(subject, index)
         self.classes[subject] = usage - 1
+        table = self._clash_table
+        if table:
+            # inserting into a block raises every other subject's clash
+            # count with that block by its pair count with the new arrival
+            pairs = self.stats._pair_counts()
+            for other, row in table.items():
+                if other != subject:
+                    row[index] += pairs[
+                        (other, subject) if other < subject
+                        else (subject, other)
+                        ]
         
     
     def raw_insert_many(self, subjects:Iterable,*,index:int):
@@ -357,46 +527,70 @@ class State:
             
             if usage <= 0:
                 return None
-            clashes = list(enumerate(self.stats.total_block_count(
-                subject_code=subject,
-                blocks=self.blocks
-            )))
+            # a heap pops candidate blocks in (clash count, block) order,
+            # replacing the min()-scan plus O(blocks) remove per attempt.
+            # ties resolve to the lowest block index, as min() did
+            heap = [
+                (count, block_num)
+                for block_num, count in enumerate(self._block_clashes(subject))
+                ]
+            heapq.heapify(heap)
             inserted = False
-            while inserted is False and len(clashes) > 0:
+            while inserted is False and heap:
                 # get the block with the smallest clash count
-                block_num, clash_count = min(clashes, key=lambda x:x[1])
+                clash_count, block_num = heapq.heappop(heap)
                 duplicates = self._find_duplicates(
-                    block_clashes=clashes, 
+                    block_clashes=chain(
+                        ((block_num, clash_count),),
+                        ((num, count) for count, num in heap)
+                        ),
                     matching=clash_count,
                     subject=subject
                     )
                 if len(duplicates) > 1 and self.allow_branching and raise_exceptions:
-            
+
                     raise exceptions.BranchRequired(
-                        state=self, 
-                        options=duplicates, 
+                        state=self,
+                        options=duplicates,
                         subject_code=subject
                         )
 
-                if self.populate_block(subject=subject, index=block_num) is False:
-                    # if we weren't able to populate the given block, remove that
-                    # block from the block clashes and move on
-                    clashes.remove((block_num, clash_count))
-                else:
-                    inserted = True
+                # a failed populate simply moves on; the candidate was
+                # already popped from the heap
+                inserted = self.populate_block(subject=subject, index=block_num)
             if inserted is False:
                 raise exceptions.SubjectError(
                     "unable to insert subject '%s' into the given option blocks" % subject
                 )
             
+    def _block_clashes(self, subject:str) -> List[int]:
+        # a subject's clash count against each block. Rows are computed
+        # from the current blocks on first request and then kept current
+        # incrementally by raw_insert, replacing a full recount per
+        # auto_populate iteration
+        table = self._clash_table
+        if table is None:
+            table = self._clash_table = {}
+        row = table.get(subject)
+        if row is None:
+            row = table[subject] = self.stats.total_block_count(
+                subject_code=subject,
+                blocks=self.blocks
+            )
+        return row
+
     def _find_duplicates(self, block_clashes, matching:int, subject:str):
         # return a list of indexes where we have multiple blocks matching the
         # same number of clashes. Blocks are ignore if they are empty or already
         # contain the subject
         indexes = []
+        masks = self.masks
+        bit = 1 << self.cache.option_id[subject]
         for block_num, count in block_clashes:
-            block = self.blocks[block_num]
-            if count == matching and len(block) > 0 and subject not in block:
+            if count == matching and self.blocks[block_num] and not masks[block_num] & bit:
                 indexes.append(block_num)
+        # candidates may arrive in heap order; keep the ascending block
+        # order callers have always seen
+        indexes.sort()
         return indexes
     
\ No newline at end of file
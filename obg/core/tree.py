@@ -4,21 +4,27 @@ from obg.utils.logging import logger
 import itertools
 import copy
 
-from functools import partial
-
 class Node:
     
     processes = process.PROCESSES
-    creation_counter = 0
-    
+    n_processes = len(process.PROCESSES)
+    # single C-level op per id, and atomic under the GIL
+    _id_gen = itertools.count()
+
+    # nodes are allocated on every branch, so skip the per-instance dict
+    __slots__ = (
+        'parent', 'children', 'state', 'cache', 'id', 'util', 'protocol',
+        'opts'
+        )
+
     def __init__(self, parent=None) -> None:
         self.parent = parent
         self.children = []
         self.state: statistics.State = None
         self.cache: statistics.Cache = None
-        
-        self.id = self.__class__.creation_counter
-        self.__class__.creation_counter = self.id + 1
+        self.opts = None
+
+        self.id = next(Node._id_gen)
         
         self.util: evaluation.EvaluationUtility = None
         self.protocol: protocols.Protocol = None
@@ -40,63 +46,88 @@ class Node:
         return "Node[%i]/%s" % (self.id, parent)
     
     def __hash__(self) -> int:
-        # how 'unique' a node will depend on the blocks it currently has
-        return hash(self.state)
+        # how 'unique' a node will depend on the blocks it currently has.
+        # the state maintains its hash incrementally on every insert, so
+        # read it directly rather than dispatching through hash()
+        return self.state._hash
     
     def run(self):
+        # iterative driver: branches push their children onto an explicit
+        # stack, so deep generation trees cost list operations rather than
+        # stacked call frames (and cannot hit the recursion limit).
+        # TerminateGeneration propagates to the caller as before
+        stack = [self]
+        while stack:
+            stack.pop().step(stack)
+
+    def step(self, stack):
         try:
-            # load the next process and execute it. If there is another process after exection,
-            # recursively call to restart.
+            # load and execute each process in turn. Consecutive processes
+            # on the same node stay in this loop; only branch children go
+            # back through the stack
             self.load_next_process().execute()
-            if self.continue_process() is True:
-                self.run()
-            else:
-                if self.cache._options.get("check_finished", False):
-                    self.is_finished()
-                    
-                self.cache.logger.output("Node complete! %s" % self.id, level="info", grouping="completion")
-                self.cache.generated_states.add(self.state)
-                
-                # handling evaluation on the fly.
-                if protocol := self.protocol.is_using(protocols.ImmediateEvaluation):
-                    result = self.util.evaluate_state(self.state)
-                    if result.success_percentage >= protocol.threshold:
-                        raise exceptions.TerminateGeneration(
-                            "state '%s' satisfied threshold" % self.state.id
-                        )
-                # limit the number of nodes that is allowed to be created.
-                if protocol:= self.protocol.is_using(protocols.LimitProtocol):
-                    if self.id + 1 > protocol.maximum:
-                        raise exceptions.TerminateGeneration(
-                            '"generation teriminated as it generated too many nodes'
-                        )
-                    
+            while self.continue_process() is True:
+                self.load_next_process().execute()
+
+            if self.cache._options.get("check_finished", False):
+                self.is_finished()
+
+            self.cache.logger.output("Node complete! %s", self.id, level="info", grouping="completion")
+            self.cache.mark_generated(self.state)
+
+            # handling evaluation on the fly.
+            if protocol := self.protocol.is_using(protocols.ImmediateEvaluation):
+                result = self.util.evaluate_state(self.state)
+                if result.success_percentage >= protocol.threshold:
+                    raise exceptions.TerminateGeneration(
+                        "state '%s' satisfied threshold" % self.state.id
+                    )
+            # limit the number of nodes that is allowed to be created.
+            if protocol:= self.protocol.is_using(protocols.LimitProtocol):
+                if self.id + 1 > protocol.maximum:
+                    raise exceptions.TerminateGeneration(
+                        '"generation teriminated as it generated too many nodes'
+                    )
+
         except (exceptions.BranchRequired) as branch:
             # process may require branch, create a new node to handle this
-            self.branch(branch)
-        
-        
-    def branch(self, branch: exceptions.BranchRequired):
-        # creates a new set of branches where needed
+            self.branch(branch, stack)
+
+
+    def branch(self, branch: exceptions.BranchRequired, stack):
+        # creates a new set of branches where needed. Children are pushed in
+        # reverse so the stack pops them in the original choice order,
+        # keeping the depth-first walk the recursive version produced
         if branch.insert:
-            log_branch = partial(self.cache.logger.output, level="debug", grouping="branching")
-            log_branch("creating '%i' new branches %s" % (len(branch.options), branch))
-            for choice in branch.options:
-                log_branch("branch executing %s [%s]" % (branch, choice))
+            # checking the grouping once skips the logging calls entirely
+            # for every choice instead of building a partial per branch
+            log = self.cache.logger
+            log_branching = log.enabled("branching")
+            if log_branching:
+                log.output(
+                    "creating '%i' new branches %s", len(branch.options), branch,
+                    level="debug", grouping="branching"
+                    )
+            for choice in reversed(branch.options):
+                if log_branching:
+                    log.output(
+                        "branch executing %s [%s]", branch, choice,
+                        level="debug", grouping="branching"
+                        )
                 new_node = self.copy()
                 if new_node.state.populate_block(
                     subject=branch.subject_code,
                     index=choice
                 ):
-                    new_node.run()
+                    stack.append(new_node)
                 else:
-                    logger.warn("branch '%s' was prevented from running" % choice)
+                    logger.warn("branch '%s' was prevented from running", choice)
         else:
             # does not insert but the state can be changed and used
             new_node = self.copy()
             if branch.override_state:
                 new_node.state = branch.state
-            new_node.run()
+            stack.append(new_node)
             
     def load_next_process(self) -> process.Process:
         # instansiate the current process
@@ -107,24 +138,29 @@ class Node:
         
     def continue_process(self):
         # check if there is another process to run and update the state
-        # with the current process to execute.
-        klass = self.__class__
-        self.state.process_index = self.state.process_index + 1
-        if self.state.process_index >= len(klass.processes):
+        # with the current process to execute. The process tuple and its
+        # length are bound once at class level; this runs on every step
+        state = self.state
+        index = state.process_index + 1
+        if index >= self.n_processes:
             return False
-        self.state.current_process = klass.processes[
-            self.state.process_index
-            ]
+        state.process_index = index
+        state.current_process = self.processes[index]
         return True
     
     def is_finished(self):
         '''
         raises validation error if not all classes have been fully dealt with
         '''
-        for subject, classes in self.state.classes.items():
-            if classes > 0:
-                raise exceptions.ValidationError(
-                    "node '%s' failed to populate fully."
-                    " Error raised from subject '%s'" % (self.id, subject)
+        classes = self.state.classes
+        # any() scans the counts without unpacking (subject, count) pairs;
+        # the offending subject is only looked up on the failure path
+        if any(count > 0 for count in classes.values()):
+            subject = next(
+                subject for subject, count in classes.items() if count > 0
                 )
+            raise exceptions.ValidationError(
+                "node '%s' failed to populate fully."
+                " Error raised from subject '%s'" % (self.id, subject)
+            )
         return True
\ No newline at end of file
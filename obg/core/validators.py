@@ -1,8 +1,29 @@
-from typing import List
+from typing import Iterable, List
 
 from obg.core.evaluation import EvaluatedObject
 from obg.core import exceptions
 
+def _all_equal(values: List[int]) -> bool:
+    '''
+    check that every value matches the first, without materialising a set
+    per call. Small byte-sized runs take a packed fast path: each value
+    becomes one byte and a single compare against the first value
+    broadcast over every lane replaces the per-element loop
+    '''
+    if not values:
+        return True
+    first = values[0]
+    if len(values) <= 8 and first < 256:
+        try:
+            packed = int.from_bytes(bytes(values), "little")
+        except ValueError:
+            # a value did not fit a byte; fall through to the scalar loop
+            pass
+        else:
+            broadcast = first * 0x0101010101010101 & ((1 << (8 * len(values))) - 1)
+            return packed == broadcast
+    return all(value == first for value in values)
+
 class Validator:
     def __init__(self) -> None:
         pass
@@ -13,8 +34,10 @@ class Validator:
 class SymmetricalAlignmentValidator(Validator):
     
     def check(self, evaluation: EvaluatedObject):
-        lengths = {len(b) for b in evaluation.blocks}
-        if lengths != len(evaluation.blocks):
+        # comparing the old length set against len(blocks) could never be
+        # equal (set vs int), so the check always raised; compare the
+        # lengths to each other instead
+        if not _all_equal([len(b) for b in evaluation.blocks]):
             raise exceptions.ValidationError("blocks are not symmetrical")
     
 class MaxSubjectsValidator(Validator):
@@ -2,8 +2,6 @@ from pathlib import Path
 import os
 import configparser
 
-from functools import partial
-
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
@@ -17,9 +15,43 @@ _GENERATION_SECTION = "GenerationSettings"
 config = configparser.ConfigParser()
 config.read(SETTINGS_LOOKUP)
 
+# settings are immutable for the life of the process, so the section is
+# materialised into a plain dict once; hot-path lookups then cost a dict
+# probe instead of configparser's section/interpolation machinery
+_values = (
+    dict(config.items(_GENERATION_SECTION))
+    if config.has_section(_GENERATION_SECTION) else {}
+)
+
+_MISSING = object()
+
+def _lookup(option, fallback, convert, parser_get):
+    value = _values.get(option, _MISSING)
+    if value is not _MISSING:
+        return convert(value)
+    if fallback is not _MISSING:
+        return fallback
+    # delegate so missing options raise configparser's usual errors
+    return parser_get(_GENERATION_SECTION, option)
+
+def _to_bool(value):
+    return configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+
 class Config:
     '''generation settings config'''
-    get = partial(config.get, _GENERATION_SECTION)
-    getbool = partial(config.getboolean, _GENERATION_SECTION)
-    getfloat = partial(config.getfloat, _GENERATION_SECTION)
-    getint = partial(config.getint, _GENERATION_SECTION)
\ No newline at end of file
+
+    @staticmethod
+    def get(option, fallback=_MISSING):
+        return _lookup(option, fallback, str, config.get)
+
+    @staticmethod
+    def getbool(option, fallback=_MISSING):
+        return _lookup(option, fallback, _to_bool, config.getboolean)
+
+    @staticmethod
+    def getfloat(option, fallback=_MISSING):
+        return _lookup(option, fallback, float, config.getfloat)
+
+    @staticmethod
+    def getint(option, fallback=_MISSING):
+        return _lookup(option, fallback, int, config.getint)
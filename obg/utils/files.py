@@ -1,17 +1,30 @@
 
 import csv
+import functools
+import itertools
 import os
-import copy
 
 from obg.utils.config import STATIC_ROOT, Config
 
 DATA_FILE_LOOKUP = "data-file"
 OPTIONS_FILE = "options-file"
 
+@functools.lru_cache(maxsize=16)
 def read_csv(path:str):
-    with open(os.path.join(STATIC_ROOT, path), "r") as file:
-        reader = csv.reader(file)
-        return list(reader)
+    '''
+    read and cache a csv from the static root. Files are immutable for
+    the life of a process, so repeat reads return the parsed rows as
+    shared tuples; call reload() after writing to a cached path
+    '''
+    # a 1 MiB buffer cuts read() syscalls for typical data files, and
+    # newline="" hands line splitting to the csv reader as the csv docs
+    # recommend
+    with open(os.path.join(STATIC_ROOT, path), "r", buffering=1<<20, newline="") as file:
+        return tuple(tuple(row) for row in csv.reader(file))
+
+def reload():
+    '''forget cached csv contents so the next read hits the disk'''
+    read_csv.cache_clear()
     
 def get_data(using=None):
     return read_csv(Config.get(using or DATA_FILE_LOOKUP))
@@ -27,32 +40,31 @@ def options_from_data(data:dict):
     return seen
 
 def reformat_data(data:dict):
-    
+
     opts = options_from_data(data)
-    mapping = dict.fromkeys(opts, None)
+    mapping = {}
     for opt in opts:
         auto = str(opt[:2]).capitalize()
         code = input("designate new code for '%s' [%s] : " % (opt, auto))
-        if not code:
-            code = auto
-        mapping[opt] = code
-    copied = copy.deepcopy(data)
-    for uid, opts in data.items():
-        
-        copied[uid] = [mapping.get(opt) for opt in opts]
+        mapping[opt] = code or auto
+    # every value is rebuilt from the mapping anyway, so a comprehension
+    # replaces the deepcopy that walked all the nested lists first
+    copied = {
+        uid: [mapping.get(opt) for opt in student]
+        for uid, student in data.items()
+        }
     return copied, list(mapping.values())
             
 def dump_reformated_data(data:dict, options:list):
     
     name = input("save DATA as : ")
-    with open(os.path.join(STATIC_ROOT, name), "w", newline='') as f:
-        writer = csv.writer(f)
-        for student in data.values():
-            writer.writerow(student)
-            
+    with open(os.path.join(STATIC_ROOT, name), "w", buffering=1<<20, newline='') as f:
+        csv.writer(f).writerows(data.values())
+
     name = input("save OPTIONS as : ")
-    with open(os.path.join(STATIC_ROOT, name), "w", newline='') as f:
-        writer = csv.writer(f)
-        for _ in range(len(options)):
-            writer.writerow(options)
-    
\ No newline at end of file
+    with open(os.path.join(STATIC_ROOT, name), "w", buffering=1<<20, newline='') as f:
+        # the options row has always been written once per option; repeat
+        # keeps that shape while writerows drives the loop in C
+        csv.writer(f).writerows(itertools.repeat(options, len(options)))
+    # the written names may shadow a cached path
+    reload()
@@ -19,10 +19,18 @@ class CustomFormatter(logging.Formatter):
         logging.CRITICAL: bold_red + format + reset
     }
 
+    def __init__(self) -> None:
+        super().__init__()
+        # one compiled Formatter per level; building one inside format()
+        # paid allocation and format-string parsing on every record
+        self._formatters = {
+            level: logging.Formatter(fmt)
+            for level, fmt in self.FORMATS.items()
+        }
+        self._default = self._formatters[logging.INFO]
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
-        return formatter.format(record)
+        return self._formatters.get(record.levelno, self._default).format(record)
     
 logger = logging.getLogger("obg")
 logger.setLevel(logging.DEBUG)
@@ -41,11 +49,19 @@ class Log:
     '''
     def __init__(self, **opts) -> None:
         self.options = opts
-        
-    def output(self, msg:str, level:str="log", grouping:str=None):
-        func = getattr(logger, level)
-        if grouping is None:
-            func(msg)
-        elif self.options.get(grouping, True) is True:
-            func(msg)
+
+    def enabled(self, grouping:str=None):
+        '''check whether output for a given grouping would actually be emitted'''
+        if logger.disabled:
+            return False
+        return grouping is None or self.options.get(grouping, True) is True
+
+    def output(self, msg:str, *args, level:str="log", grouping:str=None):
+        # bail out before any formatting work; callers pass format args
+        # separately so interpolation only happens for emitted records
+        if logger.disabled:
+            return
+        if grouping is not None and self.options.get(grouping, True) is not True:
+            return
+        getattr(logger, level)(msg, *args)
 